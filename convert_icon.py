@@ -11,6 +11,11 @@ if not os.path.exists('icon.png'):
     print("Error: icon.png not found!")
     exit(1)
 
+# icon.ico 比 icon.png 新就不用重新生成，重复构建直接跳过
+if os.path.exists('icon.ico') and os.path.getmtime('icon.ico') > os.path.getmtime('icon.png'):
+    print("icon.ico is up to date, skipping")
+    exit(0)
+
 img = Image.open('icon.png')
 
 # Windows 需要这些尺寸
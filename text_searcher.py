@@ -2,11 +2,36 @@ import os
 import sys
 import re
 import json
+import hashlib
+import io
+import mmap
+import threading
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-import chardet
-from PySide6.QtCore import QThread, Signal, Qt
+# 编码检测：优先使用 C 扩展实现（cchardet），其次 charset-normalizer，
+# 都不可用时回退到纯 Python 的 chardet，三者速度差距可达数十倍
+try:
+    from cchardet import detect as _detect
+except ImportError:
+    try:
+        from charset_normalizer import from_bytes as _cn_from_bytes
+
+        def _detect(raw_data):
+            best = _cn_from_bytes(raw_data).best()
+            return {'encoding': best.encoding if best else None}
+    except ImportError:
+        from chardet import detect as _detect
+
+# 多字面量逻辑表达式可选用 Aho-Corasick 自动机，一遍扫描找出所有命中的
+# 字面量；未安装 pyahocorasick 时退回逐个子串测试
+try:
+    import ahocorasick as _ahocorasick
+except ImportError:
+    _ahocorasick = None
+
+from PySide6.QtCore import QThread, QTimer, Signal, Qt
 from PySide6.QtWidgets import (QApplication, QMainWindow, QFileDialog, QVBoxLayout,
                                QHBoxLayout, QWidget, QPushButton, QLineEdit,
                                QPlainTextEdit, QLabel, QCheckBox, QSpinBox, QComboBox)
@@ -16,32 +41,83 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QFileDialog, QVBoxLayo
 HISTORY_FILE = Path.home() / ".text_searcher_history.json"
 MAX_HISTORY = 20
 
+# 超过该大小的文件直接跳过，避免单个超大文件拖垮整次搜索
+MAX_FILE_BYTES = 200 * 1024 * 1024
+
+# 小于该大小的文件不值得走 mmap 路径，映射的系统调用开销比直接逐行读还大
+MMAP_MIN_BYTES = 64 * 1024
+
+# 不超过该大小的文件一次性读入整体解码，免去逐行增量解码的开销
+SMALL_FILE_BYTES = 4 * 1024 * 1024
+
+# 常见二进制文件扩展名，直接跳过，不做编码检测
+BINARY_EXTENSIONS = {
+    '.exe', '.dll', '.so', '.dylib', '.a', '.o', '.pyc', '.class',
+    '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.icns',
+    '.zip', '.gz', '.bz2', '.xz', '.7z', '.rar', '.tar',
+    '.pdf', '.doc', '.xls', '.ppt', '.db', '.sqlite',
+}
+
+# 文本文件中正常出现的字节：常见控制字符、可打印 ASCII、ESC，
+# 以及所有高位字节（多字节编码如 GBK/UTF-8 的中文都落在这里）
+_TEXT_BYTES = (bytes(range(7, 14)) + b'\x1b' + bytes(range(32, 127))
+               + bytes(range(128, 256)))
+
+# 全部 ASCII 字节，用于 translate 快速判断样本是否为纯 ASCII
+_ASCII_BYTES = bytes(range(128))
+
+
+def _looks_binary(head):
+    """根据文件头部字节判断是否为二进制文件"""
+    if not head:
+        return False
+    # UTF-16/UTF-32 文本每个字符都带 NUL 字节，先认 BOM 再做 NUL 嗅探，
+    # 这类文件交给后面的编码检测正常处理
+    if head.startswith((b'\xff\xfe', b'\xfe\xff', b'\x00\x00\xfe\xff')):
+        return False
+    # NUL 字节几乎只出现在二进制文件中
+    if b'\x00' in head[:4096]:
+        return True
+    # 非文本字节占比过高也视为二进制（translate 是 C 级单遍扫描）
+    junk = head.translate(None, _TEXT_BYTES)
+    return len(junk) > len(head) * 0.30
+
 
 class KeywordHistory:
     """管理关键字搜索历史"""
 
-    @staticmethod
-    def load():
+    # 进程内缓存，首次 load 后历史操作不再重读磁盘上的 JSON
+    _cache = None
+
+    @classmethod
+    def load(cls):
         """加载历史记录"""
+        if cls._cache is not None:
+            return cls._cache
+        keywords, ignore_keywords = [], []
         if HISTORY_FILE.exists():
             try:
                 with open(HISTORY_FILE, "r", encoding="utf-8") as f:
                     data = json.load(f)
-                    return data.get("keywords", []), data.get("ignore_keywords", [])
+                    keywords = data.get("keywords", [])
+                    ignore_keywords = data.get("ignore_keywords", [])
             except Exception:
-                return [], []
-        return [], []
+                keywords, ignore_keywords = [], []
+        cls._cache = (keywords, ignore_keywords)
+        return cls._cache
 
-    @staticmethod
-    def save(keywords, ignore_keywords):
+    @classmethod
+    def save(cls, keywords, ignore_keywords):
         """保存历史记录"""
+        cls._cache = (keywords, ignore_keywords)
         try:
             HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
             with open(HISTORY_FILE, "w", encoding="utf-8") as f:
+                # 历史文件只有程序自己读，紧凑格式写得更快也更小
                 json.dump({
                     "keywords": keywords,
                     "ignore_keywords": ignore_keywords
-                }, f, ensure_ascii=False, indent=2)
+                }, f, ensure_ascii=False, separators=(',', ':'))
         except Exception:
             pass
 
@@ -78,6 +154,85 @@ class KeywordHistory:
         return ignore_keywords
 
 
+# 逻辑表达式语法树节点：每行匹配只做子串测试和布尔短路
+class _ContainsNode:
+    """字面量子串测试"""
+    __slots__ = ('literal',)
+
+    def __init__(self, literal):
+        self.literal = literal
+
+    def match(self, text):
+        return self.literal in text
+
+    def match_hits(self, hits):
+        return self.literal in hits
+
+
+class _NotNode:
+    """逻辑非"""
+    __slots__ = ('child',)
+
+    def __init__(self, child):
+        self.child = child
+
+    def match(self, text):
+        return not self.child.match(text)
+
+    def match_hits(self, hits):
+        return not self.child.match_hits(hits)
+
+
+class _AndNode:
+    """逻辑与，短路求值"""
+    __slots__ = ('children',)
+
+    def __init__(self, children):
+        self.children = children
+
+    def match(self, text):
+        return all(child.match(text) for child in self.children)
+
+    def match_hits(self, hits):
+        return all(child.match_hits(hits) for child in self.children)
+
+
+class _OrNode:
+    """逻辑或，短路求值"""
+    __slots__ = ('children',)
+
+    def __init__(self, children):
+        self.children = children
+
+    def match(self, text):
+        return any(child.match(text) for child in self.children)
+
+    def match_hits(self, hits):
+        return any(child.match_hits(hits) for child in self.children)
+
+
+def _collect_literals(node, out):
+    """收集语法树里出现的所有字面量"""
+    if isinstance(node, _ContainsNode):
+        out.append(node.literal)
+    elif isinstance(node, _NotNode):
+        _collect_literals(node.child, out)
+    else:
+        for child in node.children:
+            _collect_literals(child, out)
+
+
+# 逻辑表达式用到的正则提前编译好，避免每次解析都查 re 缓存、重新分析模式
+_AND_RE = re.compile(r'\band\b')
+_OR_RE = re.compile(r'\bor\b')
+_NOT_PAREN_RE = re.compile(r'\bnot\s*\(')
+_NOT_DQ_RE = re.compile(r'!\s*\(\s*"([^"]*)"\s*\)')
+_NOT_SQ_RE = re.compile(r"!\s*\(\s*'([^']*)'\s*\)")
+_NOT_EXPR_RE = re.compile(r'!\s*\(([^)]+)\)')
+_DQ_RE = re.compile(r'"([^"]*)"')
+_SQ_RE = re.compile(r"'([^']*)'")
+
+
 class LogicalExpressionParser:
     """解析逻辑搜索表达式，支持 and, or, &, |, not 运算符"""
 
@@ -87,61 +242,192 @@ class LogicalExpressionParser:
 
     def parse(self):
         """解析表达式并返回一个匹配函数"""
+        # 优先解析成小型语法树：逐行匹配只走子串测试加布尔短路，
+        # 没有 eval 的帧创建开销，not("x") 等写法也能正确处理
+        try:
+            root = self._parse_ast()
+        except Exception:
+            root = None
+        if root is not None:
+            return self._build_matcher(root)
+
+        # 语法树解析不了的表达式回退到 eval 路径
         try:
             # 预处理：将 and/or/&/|/not 替换为内部标记
             expr = self._preprocess(self.expression)
-            # 返回一个lambda函数用于匹配
-            return lambda text: self._evaluate(expr, text)
-        except Exception as e:
+            # 正则改写和源码解析只做一次，编译成代码对象后逐行执行字节码
+            py_expr = self._convert_to_python(expr)
+            code = compile(py_expr, '<logic>', 'eval')
+
+            def matcher(text):
+                try:
+                    return eval(code, {"__builtins__": {}}, {'text': text})
+                except Exception:
+                    return False
+
+            return matcher
+        except Exception:
             # 如果解析失败，返回一个总是返回False的函数
             return lambda text: False
 
+    def _build_matcher(self, root):
+        """由语法树生成匹配函数
+
+        字面量较多时（如 "ERROR" or "WARN" or "FATAL" ...），逐个 in 测试
+        要把每行扫 N 遍；装了 pyahocorasick 就改用自动机一遍找出所有命中
+        的字面量，再在命中集合上求值布尔表达式。
+        """
+        # 纯 OR 的字面量组合（常见的 "ERROR" or "WARN" or ... 查询）编译成
+        # 一个交替正则：C 级单遍扫描，且在第一个命中处就短路返回
+        if isinstance(root, _OrNode) and all(
+                isinstance(child, _ContainsNode) for child in root.children):
+            union = re.compile('|'.join(
+                re.escape(child.literal) for child in root.children))
+            return lambda text: union.search(text) is not None
+
+        literals = []
+        _collect_literals(root, literals)
+        unique_literals = set(literals)
+        if (_ahocorasick is not None and len(unique_literals) >= 3
+                and '' not in unique_literals):
+            automaton = _ahocorasick.Automaton()
+            for literal in unique_literals:
+                automaton.add_word(literal, literal)
+            automaton.make_automaton()
+
+            def matcher(text):
+                hits = {value for _, value in automaton.iter(text)}
+                return root.match_hits(hits)
+
+            return matcher
+        return root.match
+
+    def _parse_ast(self):
+        """把表达式解析成语法树，返回根节点
+
+        文法（优先级从低到高）::
+
+            or_expr  := and_expr (('or' | '|') and_expr)*
+            and_expr := not_expr (('and' | '&') not_expr)*
+            not_expr := ('not' | '!') not_expr | atom
+            atom     := "字面量" | '字面量' | '(' or_expr ')'
+
+        无法识别的写法抛出 ValueError，由调用方回退到 eval 路径。
+        """
+        tokens = self._tokenize(self.expression)
+        if not tokens:
+            raise ValueError("空表达式")
+        self.pos = 0
+        root = self._parse_or(tokens)
+        if self.pos != len(tokens):
+            raise ValueError(f"表达式在 {tokens[self.pos]} 处无法解析")
+        return root
+
+    def _tokenize(self, expr):
+        """把表达式拆成 ('lit', 字符串) / 'and' / 'or' / 'not' / '(' / ')'"""
+        tokens = []
+        i = 0
+        n = len(expr)
+        while i < n:
+            c = expr[i]
+            if c.isspace():
+                i += 1
+            elif c in '"\'':
+                end = expr.find(c, i + 1)
+                if end == -1:
+                    raise ValueError("引号未闭合")
+                tokens.append(('lit', expr[i + 1:end]))
+                i = end + 1
+            elif c == '&':
+                tokens.append('and')
+                i += 1
+            elif c == '|':
+                tokens.append('or')
+                i += 1
+            elif c == '!':
+                tokens.append('not')
+                i += 1
+            elif c in '()':
+                tokens.append(c)
+                i += 1
+            elif c.isalpha():
+                j = i
+                while j < n and expr[j].isalpha():
+                    j += 1
+                word = expr[i:j]
+                if word not in ('and', 'or', 'not'):
+                    raise ValueError(f"未知的标识符: {word}")
+                tokens.append(word)
+                i = j
+            else:
+                raise ValueError(f"无法识别的字符: {c}")
+        return tokens
+
+    def _parse_or(self, tokens):
+        children = [self._parse_and(tokens)]
+        while self.pos < len(tokens) and tokens[self.pos] == 'or':
+            self.pos += 1
+            children.append(self._parse_and(tokens))
+        return children[0] if len(children) == 1 else _OrNode(children)
+
+    def _parse_and(self, tokens):
+        children = [self._parse_not(tokens)]
+        while self.pos < len(tokens) and tokens[self.pos] == 'and':
+            self.pos += 1
+            children.append(self._parse_not(tokens))
+        return children[0] if len(children) == 1 else _AndNode(children)
+
+    def _parse_not(self, tokens):
+        if self.pos < len(tokens) and tokens[self.pos] == 'not':
+            self.pos += 1
+            return _NotNode(self._parse_not(tokens))
+        return self._parse_atom(tokens)
+
+    def _parse_atom(self, tokens):
+        if self.pos >= len(tokens):
+            raise ValueError("表达式不完整")
+        token = tokens[self.pos]
+        if token == '(':
+            self.pos += 1
+            node = self._parse_or(tokens)
+            if self.pos >= len(tokens) or tokens[self.pos] != ')':
+                raise ValueError("括号未闭合")
+            self.pos += 1
+            return node
+        if isinstance(token, tuple):
+            self.pos += 1
+            return _ContainsNode(token[1])
+        raise ValueError(f"意外的标记: {token}")
+
     def _preprocess(self, expr):
         """预处理表达式，规范化运算符"""
         # 将 and 替换为 &
-        expr = re.sub(r'\band\b', ' & ', expr)
+        expr = _AND_RE.sub(' & ', expr)
         # 将 or 替换为 |
-        expr = re.sub(r'\bor\b', ' | ', expr)
+        expr = _OR_RE.sub(' | ', expr)
         # 处理 not("x") 格式
-        expr = re.sub(r'\bnot\s*\(', '!', expr)
+        expr = _NOT_PAREN_RE.sub('!', expr)
         return expr
 
-    def _evaluate(self, expr, text):
-        """评估表达式是否匹配文本"""
-        try:
-            # 使用安全的评估方式
-            # 将字符串字面量提取出来，然后用Python表达式评估
-            # 这里使用一个简化的解析器
-
-            # 首先提取所有引号包裹的字符串
-            import ast
-            # 转换表达式为Python可执行的表达式
-            # 将 "string" 转换为 '"string"' in text
-            py_expr = self._convert_to_python(expr)
-            # 创建安全的执行环境
-            safe_dict = {'text': text}
-            return eval(py_expr, {"__builtins__": {}}, safe_dict)
-        except:
-            return False
-
     def _convert_to_python(self, expr):
         """将逻辑表达式转换为Python表达式"""
         # 处理!("xxx") 格式
-        expr = re.sub(r'!\s*\(\s*"([^"]*)"\s*\)', r'("\1" not in text)', expr)
-        expr = re.sub(r"!\s*\(\s*'([^']*)'\s*\)", r"('\1' not in text)", expr)
+        expr = _NOT_DQ_RE.sub(r'("\1" not in text)', expr)
+        expr = _NOT_SQ_RE.sub(r"('\1' not in text)", expr)
 
         # 处理!("xxx") 格式（可能没有引号保护的情况）
-        expr = re.sub(r'!\s*\(([^)]+)\)', r'not (\1)', expr)
+        expr = _NOT_EXPR_RE.sub(r'not (\1)', expr)
 
         # 处理 "string" -> '"string" in text'
-        expr = re.sub(r'"([^"]*)"', r'("\1" in text)', expr)
-        expr = re.sub(r"'([^']*)'", r"('\1' in text)", expr)
+        expr = _DQ_RE.sub(r'("\1" in text)', expr)
+        expr = _SQ_RE.sub(r"('\1' in text)", expr)
 
         return expr
 
 
 class SearchThread(QThread):
-    search_progress = Signal(str, int)  # 发送结果和当前计数
+    search_progress_batch = Signal(list, int)  # 发送一批结果和当前计数
+    count_update = Signal(int)  # 显示限制触发后只更新计数，不再携带结果文本
     search_finished = Signal(int, bool)  # 搜索完成，发送总计数和是否被取消
     search_error = Signal(str)  # 发送错误信息
 
@@ -157,6 +443,24 @@ class SearchThread(QThread):
         self.ignore_keyword = ignore_keyword
         self.use_ignore_logical = use_ignore_logical
         self._is_running = True
+        # 编码检测缓存：头部内容摘要 -> 编码（内容相同的文件只检测一次）
+        self._enc_cache = {}
+        # 按扩展名的编码缓存：扩展名 -> [编码, 命中次数]。
+        # 同一次扫描里同类文件编码几乎总是一致，连续命中 3 次后直接复用
+        self._ext_enc_cache = {}
+        # 结果计数由多个工作线程共享，用锁保护；命中先攒在缓冲里，
+        # 凑满一批才跨线程发一次信号
+        self._result_count = 0
+        self._count_lock = threading.Lock()
+        self._hit_buffer = []
+        # UI 达到显示限制后由主线程置位；之后不再打包结果文本，
+        # 只定期上报计数
+        self._display_limited = False
+
+        # 普通子串搜索（无逻辑表达式、无上下文、无忽略关键字）可以走
+        # mmap 快速路径，内存占用与文件大小无关
+        self._plain_fast_path = (not use_logical_search and context_lines == 0
+                                 and not (ignore_keyword and ignore_keyword.strip()))
 
         # 准备匹配函数
         if use_logical_search:
@@ -173,154 +477,444 @@ class SearchThread(QThread):
         else:
             self.ignore_matcher = None
 
-    def _should_ignore(self, line):
-        """检查是否应该忽略该行"""
-        if self.ignore_matcher is None:
-            return False
-        return self.ignore_matcher(line)
+    def _iter_files(self, root):
+        """遍历目录树，产出普通文件的 DirEntry
 
-    def run(self):
-        result_count = 0
+        直接使用 os.scandir 而不是 os.walk，复用 readdir 带回的类型信息，
+        每个条目省掉一次 stat；跳过符号链接和设备、socket 等非普通文件。
+        用显式栈迭代而非递归，深目录树不受递归深度限制，也省掉逐层
+        生成器转发的开销。
+        """
+        stack = deque([root])
+        while stack:
+            if not self._is_running:
+                return
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False):
+                                yield entry
+                        except OSError:
+                            continue
+            except OSError:
+                # 目录不可读（权限等），跳过
+                continue
 
+    def run(self):
         if self.is_folder:
-            # 文件夹模式：遍历目录
-            for root, dirs, files in os.walk(self.target):
-                if not self._is_running:
-                    self.search_finished.emit(result_count, True)
-                    return
-                for file in files:
+            # 文件夹模式：先收集候选文件，再分发给线程池并行搜索。
+            # 各文件互相独立，搜索以 I/O 为主，线程池可以接近线性扩展
+            file_paths = []
+            file_filter = self.file_filter.strip() if self.file_filter else ""
+            for entry in self._iter_files(self.target):
+                # 文件过滤
+                if file_filter and file_filter not in entry.name:
+                    continue
+                # 明显的二进制文件和超大文件在遍历阶段就排除
+                if os.path.splitext(entry.name)[1].lower() in BINARY_EXTENSIONS:
+                    continue
+                try:
+                    if entry.stat(follow_symlinks=False).st_size > MAX_FILE_BYTES:
+                        # 超大文件只有 mmap 路径能以常数内存处理；
+                        # 逐行解码模式下跳过并告知用户
+                        if not self._plain_fast_path:
+                            self.search_error.emit(
+                                f"文件过大，已跳过: {entry.path}")
+                            continue
+                except OSError:
+                    continue
+                file_paths.append(entry.path)
+            if not self._is_running:
+                self._flush_hits()
+                self.search_finished.emit(self._result_count, True)
+                return
+
+            # 线程数封顶，核很多的机器上过宽的池只会增加调度和锁竞争
+            max_workers = min(32, (os.cpu_count() or 4) * 2)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(self._search_file, path)
+                           for path in file_paths]
+                for future in as_completed(futures):
                     if not self._is_running:
-                        self.search_finished.emit(result_count, True)
-                        return
-                    # 文件过滤
-                    if self.file_filter and self.file_filter.strip() and self.file_filter.strip() not in file:
-                        continue
-                    file_path = os.path.join(root, file)
-                    result_count = self._search_file(file_path, result_count)
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        break
         else:
             # 单文件模式：直接搜索指定文件
-            result_count = self._search_file(self.target, result_count)
-
-        self.search_finished.emit(result_count, False)
+            self._search_file(self.target)
+
+        self._flush_hits()
+        self.search_finished.emit(self._result_count, not self._is_running)
+
+    def _emit_hit(self, result):
+        """累加结果计数并缓冲结果（线程安全）
+
+        每条命中都发一次跨线程信号的话，Qt 的排队分发开销在高命中率下
+        会反过来拖住搜索线程；这里攒满 100 条才发一批。
+        UI 已经不再显示新结果时（显示限制），连结果文本都不攒了，
+        每 1000 条命中只发一个轻量的计数信号。
+        """
+        if self._display_limited:
+            with self._count_lock:
+                self._result_count += 1
+                count = self._result_count
+            if count % 1000 == 0:
+                self.count_update.emit(count)
+            return
+        with self._count_lock:
+            self._result_count += 1
+            count = self._result_count
+            self._hit_buffer.append(result)
+            if len(self._hit_buffer) >= 100:
+                batch, self._hit_buffer = self._hit_buffer, []
+            else:
+                batch = None
+        if batch is not None:
+            self.search_progress_batch.emit(batch, count)
+
+    def _flush_hits(self):
+        """把缓冲里剩余的命中发给 UI 线程"""
+        with self._count_lock:
+            batch, self._hit_buffer = self._hit_buffer, []
+            count = self._result_count
+        if batch:
+            self.search_progress_batch.emit(batch, count)
+
+    def _detect_encoding(self, file_path, raw_data):
+        """检测文件头部字节的编码
+
+        绝大多数文本文件是 ASCII/UTF-8，先做廉价检查（BOM、utf-8 试解码），
+        只有都失败时才调用开销很大的 chardet；结果按头部内容摘要缓存，
+        同类文件无需重复检测。返回 None 表示无法确定编码。
+        """
+        # BOM 检查。UTF-32-LE 的 BOM 以 UTF-16-LE 的 BOM 开头，
+        # 必须先判 4 字节的 UTF-32 再判 2 字节的 UTF-16
+        if raw_data.startswith(b'\xef\xbb\xbf'):
+            return 'utf-8-sig'
+        if (raw_data.startswith(b'\xff\xfe\x00\x00')
+                or raw_data.startswith(b'\x00\x00\xfe\xff')):
+            return 'utf-32'
+        if raw_data.startswith(b'\xff\xfe') or raw_data.startswith(b'\xfe\xff'):
+            return 'utf-16'
+
+        # 纯 ASCII 文件（代码、英文日志的绝大多数）连解码尝试都可以省掉：
+        # translate 删掉全部 ASCII 字节后剩空串即是，一遍 C 级扫描
+        if not raw_data.translate(None, _ASCII_BYTES):
+            return 'utf-8'
+
+        # 先尝试 utf-8（覆盖绝大多数文本文件）
+        try:
+            raw_data.decode('utf-8')
+            return 'utf-8'
+        except UnicodeDecodeError as e:
+            # 采样可能把多字节字符截断在末尾，这种情况仍视为 utf-8
+            if e.start >= len(raw_data) - 4:
+                return 'utf-8'
+
+        # 按头部内容摘要查缓存：仓库里大量内容相同的小文件（License 头、
+        # 雷同的 __init__.py 等）只需检测一次。blake2b 是 C 实现，比
+        # 统计检测便宜得多
+        ext = os.path.splitext(file_path)[1].lower()
+        cache_key = hashlib.blake2b(raw_data, digest_size=8).digest()
+        cached = self._enc_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # 同一扩展名连续检测出相同编码 3 次后，后续文件直接复用
+        ext_entry = self._ext_enc_cache.get(ext)
+        if ext_entry is not None and ext_entry[1] >= 3:
+            return ext_entry[0]
+
+        result = _detect(raw_data)
+        encoding = result['encoding']
+        if encoding:
+            self._enc_cache[cache_key] = encoding
+            if ext_entry is not None and ext_entry[0] == encoding:
+                ext_entry[1] += 1
+            else:
+                self._ext_enc_cache[ext] = [encoding, 1]
+        return encoding
 
-    def _search_file(self, file_path, result_count):
+    def _search_file(self, file_path):
         """搜索单个文件"""
-        # 尝试多种编码方式打开文件
-        encodings = []
+        # 跳过明显的二进制文件
+        if os.path.splitext(file_path)[1].lower() in BINARY_EXTENSIONS:
+            return
+
+        # 只打开一次文件：同一个描述符既做编码嗅探又做正文扫描，
+        # 省掉每个文件第二组 open/close 系统调用
         try:
-            # 读取部分文件内容以检测编码
-            with open(file_path, 'rb') as f:
-                raw_data = f.read(10000)
-                result = chardet.detect(raw_data)
-                if result['encoding']:
-                    encodings.append(result['encoding'])
-        except Exception:
-            pass
+            fb = open(file_path, 'rb', buffering=1024 * 1024)
+        except OSError as e:
+            self.search_error.emit(f"无法读取文件: {file_path}\n错误: {e}")
+            return
 
-        # 添加常用编码作为备选
-        encodings.extend(['utf-8', 'gbk', 'gb2312', 'gb18030'])
-        # 去重，保留顺序
-        seen = set()
-        unique_encodings = []
-        for enc in encodings:
-            if enc and enc not in seen:
-                seen.add(enc)
-                unique_encodings.append(enc)
-
-        # 尝试每种编码
-        for encoding in unique_encodings:
+        with fb:
             try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    if self.context_lines > 0:
-                        # 使用上下文窗口模式
-                        return self._search_with_context(f, file_path, result_count)
-                    else:
-                        # 普通模式
-                        return self._search_normal(f, file_path, result_count)
-            except (UnicodeDecodeError, LookupError):
-                continue
-            except Exception as e:
+                # 4 KB 样本对编码判断已经足够，还能让慢路径的 chardet 少扫一半多
+                raw_data = fb.read(4096)
+            except OSError as e:
                 self.search_error.emit(f"无法读取文件: {file_path}\n错误: {e}")
-                return result_count
+                return
+
+            # 扩展名不在黑名单但内容是二进制的文件（图片、可执行文件等）
+            # 在这里拦截，避免白白跑一遍编码检测和逐行解码
+            if _looks_binary(raw_data):
+                return
+
+            encodings = []
+            encoding = self._detect_encoding(file_path, raw_data)
+            if encoding:
+                encodings.append(encoding)
+            # 添加常用编码作为备选
+            encodings.extend(['utf-8', 'gbk', 'gb2312', 'gb18030'])
+            # 去重，保留顺序
+            seen = set()
+            unique_encodings = []
+            for enc in encodings:
+                if enc and enc not in seen:
+                    seen.add(enc)
+                    unique_encodings.append(enc)
 
-        # 所有编码都失败，尝试带错误忽略的方式
-        try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            try:
+                file_size = os.fstat(fb.fileno()).st_size
+            except OSError:
+                file_size = 0
+
+            # 普通子串搜索（无逻辑表达式、无上下文、无忽略关键字）且文件够大时
+            # 走 mmap 快速路径：直接在原始字节上用 C 级 find 定位关键字，
+            # 只解码命中的行
+            if self._plain_fast_path and file_size > MMAP_MIN_BYTES:
+                if self._search_normal_mmap(fb, file_path, unique_encodings[0]):
+                    return
+
+            # 小文件（绝大多数源码和日志都在这一档）一次性读完整体解码：
+            # 一次 read 加一次 C 级 decode，比 TextIOWrapper 按块增量解码
+            # 少跑一整层 Python 循环
+            if file_size <= SMALL_FILE_BYTES:
+                fb.seek(0)
+                try:
+                    data = fb.read()
+                except OSError as e:
+                    self.search_error.emit(f"无法读取文件: {file_path}\n错误: {e}")
+                    return
+                # 候选编码直接在内存里依次严格试解码，不再为换编码重新
+                # 读一遍文件；全部失败才退回替换字符解码，保证整趟只读一次
+                text = None
+                for enc in unique_encodings:
+                    try:
+                        text = data.decode(enc)
+                        break
+                    except (UnicodeDecodeError, LookupError):
+                        continue
+                if text is None:
+                    try:
+                        text = data.decode(unique_encodings[0], 'replace')
+                    except LookupError:
+                        text = data.decode('utf-8', 'replace')
+                # 纯子串搜索不需要逐行遍历，直接在整段文本上 find
+                if self._plain_fast_path:
+                    return self._search_normal_whole(text, file_path)
+                # 用 StringIO 按行迭代：只在 \n 处分行，与文件对象和
+                # 字节级路径的行号口径一致（splitlines 还会在 \f、\v、
+                # \u2028 等处切行，行号会漂移）
+                lines = io.StringIO(text)
+                if self.context_lines > 0:
+                    return self._search_with_context(lines, file_path)
+                return self._search_normal(lines, file_path)
+
+            # 用检测出的编码扫描。errors='replace' 让个别坏字节变成替换
+            # 字符而不是抛异常——严格模式下中途出错会丢掉之前已发出的
+            # 结果，还可能换个编码重扫导致重复上报
+            fb.seek(0)
+            try:
+                tw = io.TextIOWrapper(fb, encoding=unique_encodings[0],
+                                      errors='replace')
+            except LookupError:
+                # 检测返回了 Python 不认识的编码名
+                tw = io.TextIOWrapper(fb, encoding='utf-8', errors='replace')
+            try:
                 if self.context_lines > 0:
-                    return self._search_with_context(f, file_path, result_count)
+                    # 使用上下文窗口模式
+                    return self._search_with_context(tw, file_path)
                 else:
-                    return self._search_normal(f, file_path, result_count)
-        except Exception as e:
-            self.search_error.emit(f"无法读取文件: {file_path}\n错误: {e}")
-            return result_count
+                    # 普通模式
+                    return self._search_normal(tw, file_path)
+            except OSError as e:
+                self.search_error.emit(f"无法读取文件: {file_path}\n错误: {e}")
+                return
+            finally:
+                # 解除包装，避免 TextIOWrapper 提前关闭底层文件
+                tw.detach()
+
+    def _search_normal_mmap(self, fb, file_path, encoding):
+        """普通搜索的 mmap 快速路径
+
+        把文件映射进内存后用 bytes.find（C 实现）扫描原始字节，按命中位置
+        增量统计换行数得到行号，只解码命中的那一行用于展示。处理完返回
+        True；无法使用快速路径时返回 None，由调用方回退到逐行搜索。
+        """
+        # utf-8-sig 编出的关键字会带 BOM 前缀，正文里永远搜不到；
+        # 去掉 -sig 后就是普通 utf-8
+        if encoding == 'utf-8-sig':
+            encoding = 'utf-8'
+        try:
+            kw = self.keyword.encode(encoding)
+            # 字节级扫描假设换行是单个 b'\n'，只有与 ASCII 兼容的编码
+            # 满足；utf-16/utf-32 这类宽编码回退到解码路径
+            if '\n'.encode(encoding) != b'\n':
+                return None
+        except (UnicodeEncodeError, LookupError):
+            # 关键字无法用该编码表示，回退到逐行解码路径
+            return None
+
+        try:
+            try:
+                mm = mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # 空文件无法映射，也不可能有匹配
+                return True
+
+            with mm:
+                prefix = f"{file_path} (line "
+                size = len(mm)
+                line_number = 1
+                counted_upto = 0  # 换行数已统计到的位置
+                pos = mm.find(kw)
+                while pos != -1:
+                    if not self._is_running:
+                        return True
+                    line_number += mm[counted_upto:pos].count(b'\n')
+                    counted_upto = pos
+                    # 定位命中所在行的边界
+                    line_start = mm.rfind(b'\n', 0, pos) + 1
+                    line_end = mm.find(b'\n', pos)
+                    if line_end == -1:
+                        line_end = size
+                    line = mm[line_start:line_end].decode(encoding, 'replace')
+                    self._emit_hit(
+                        ''.join((prefix, str(line_number), '): ',
+                                 line.strip(), '\n')))
+                    # 每行只报告一次，从行尾继续搜索
+                    pos = mm.find(kw, line_end + 1)
+                return True
+        except OSError:
+            return None
 
-    def _search_normal(self, f, file_path, result_count):
+    def _search_normal_whole(self, text, file_path):
+        """普通搜索在整体解码文本上的快速路径
+
+        与 mmap 路径同一套办法，只是作用在 str 上：str.find（C 实现）
+        直接跳到下一处命中，行号按命中位置增量统计换行数得到，只对
+        命中行做切分。整趟没有 Python 层的逐行循环。
+        """
+        kw = self.keyword
+        prefix = f"{file_path} (line "
+        emit_hit = self._emit_hit
+        size = len(text)
+        line_number = 1
+        counted_upto = 0  # 换行数已统计到的位置
+        pos = text.find(kw)
+        while pos != -1:
+            if not self._is_running:
+                return
+            line_number += text.count('\n', counted_upto, pos)
+            counted_upto = pos
+            # 定位命中所在行的边界
+            line_start = text.rfind('\n', 0, pos) + 1
+            line_end = text.find('\n', pos)
+            if line_end == -1:
+                line_end = size
+            emit_hit(
+                ''.join((prefix, str(line_number), '): ',
+                         text[line_start:line_end].strip(), '\n')))
+            # 每行只报告一次，从行尾继续搜索
+            pos = text.find(kw, line_end + 1)
+
+    def _search_normal(self, f, file_path):
         """普通搜索模式"""
+        # 文件路径前缀在整个文件内不变，提到循环外只拼一次
+        prefix = f"{file_path} (line "
+        # 没配忽略关键字（最常见情况）时热循环里连判断都不做；
+        # matcher/_emit_hit 也提前绑定成局部名，省掉每行两次属性查找
+        ignore = self.ignore_matcher
+        matcher = self.matcher
+        emit_hit = self._emit_hit
         for line_number, line in enumerate(f, start=1):
-            if not self._is_running:
-                return result_count
-            # 检查是否应该忽略该行
-            if self._should_ignore(line):
+            # 取消标志每 1024 行才看一次，足够及时又不在每行上花钱
+            if not (line_number & 1023) and not self._is_running:
+                return
+            if ignore is not None and ignore(line):
                 continue
-            if self.matcher(line):
-                result = f"{file_path} (line {line_number}): {line.strip()}\n"
-                self.search_progress.emit(result, result_count + 1)
-                result_count += 1
-        return result_count
-
-    def _search_with_context(self, f, file_path, result_count):
-        """带上下文的搜索模式"""
+            if matcher(line):
+                emit_hit(
+                    ''.join((prefix, str(line_number), '): ', line.strip(), '\n')))
+
+    def _search_with_context(self, f, file_path):
+        """带上下文的搜索模式
+
+        单遍滑动窗口：之前的上下文取自窗口，之后的上下文挂在待完成
+        列表上、由后续行补齐。不再在循环体里嵌套 next(f) 预读——预读
+        会让 enumerate 的行号与文件实际位置脱节，补出来的行号随之漂
+        移，预读过的行也不会再参与匹配。
+        """
         # 使用 deque 缓存之前的非忽略行
-        context_buffer = deque(maxlen=self.context_lines)
-
+        context_lines = self.context_lines
+        context_buffer = deque(maxlen=context_lines)
+        # 命中后还在等后文的结果：[已组好的行列表, 还缺的后文行数]。
+        # 各项每行同步递减，先命中的先补齐，完成项总在列表前端
+        pending = []
+
+        # 没配忽略关键字（最常见情况）时热循环里连判断都不做；
+        # matcher 同样提前绑定成局部名
+        ignore = self.ignore_matcher
+        matcher = self.matcher
+        emit_hit = self._emit_hit
+        sep = '=' * 80
         for line_number, line in enumerate(f, start=1):
-            if not self._is_running:
-                return result_count
+            # 取消标志每 1024 行才看一次，足够及时又不在每行上花钱
+            if not (line_number & 1023) and not self._is_running:
+                return
 
-            # 检查是否应该忽略该行
-            if self._should_ignore(line):
+            if ignore is not None and ignore(line):
                 # 忽略的行不计入上下文
                 continue
 
-            context_buffer.append((line_number, line))
-
-            if self.matcher(line):
-                # 构建带上下文的结果
-                result_lines = []
-                result_lines.append(f"{'='*80}")
-                result_lines.append(f"{file_path} (line {line_number}):")
-
-                # 添加之前的上下文
+            # 每行只 rstrip 一次，缓存里直接存处理好的文本，
+            # 命中多时同一行不会被反复清理
+            stripped = line.rstrip()
+
+            # 当前行先给等后文的结果补一行
+            if pending:
+                finished = 0
+                for entry in pending:
+                    entry[0].append(f"  {line_number}: {stripped}")
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        entry[0].append(f"{sep}\n")
+                        emit_hit("\n".join(entry[0]))
+                        finished += 1
+                if finished:
+                    del pending[:finished]
+
+            if matcher(line):
+                # 构建结果头部和之前的上下文
+                result_lines = [sep, f"{file_path} (line {line_number}):"]
                 for ctx_line_num, ctx_line in context_buffer:
-                    if ctx_line_num < line_number:
-                        result_lines.append(f"  {ctx_line_num}: {ctx_line.rstrip()}")
-
-                # 标记当前匹配行
-                result_lines.append(f"> {line_number}: {line.rstrip()}")
-
-                # 读取并添加后续的上下文行（跳过忽略的行）
-                future_lines = []
-                collected = 0
-                while collected < self.context_lines:
-                    try:
-                        future_line = next(f)
-                        future_line_num = line_number + collected + 1
-                        # 检查是否应该忽略该行
-                        if self._should_ignore(future_line):
-                            continue
-                        future_lines.append(f"  {future_line_num}: {future_line.rstrip()}")
-                        collected += 1
-                    except StopIteration:
-                        break
+                    result_lines.append(f"  {ctx_line_num}: {ctx_line}")
+                # 标记当前匹配行，挂入待完成列表等后文
+                result_lines.append(f"> {line_number}: {stripped}")
+                pending.append([result_lines, context_lines])
 
-                result_lines.extend(future_lines)
-                result_lines.append(f"{'='*80}\n")
+            context_buffer.append((line_number, stripped))
 
-                result = "\n".join(result_lines)
-                self.search_progress.emit(result, result_count + 1)
-                result_count += 1
-
-        return result_count
+        # 文件结尾后文不足的结果按已有内容收尾
+        for entry in pending:
+            entry[0].append(f"{sep}\n")
+            emit_hit("\n".join(entry[0]))
 
     def stop(self):
         self._is_running = False
@@ -336,13 +930,16 @@ class KeywordSearchApp(QMainWindow):
         self.search_thread = None
 
         # 批量处理优化：缓冲区和定时器
-        self.result_buffer = []  # 缓存待显示的结果
-        self.batch_size = 100  # 每100条结果更新一次UI
-        self.count_update_interval = 10  # 每10条结果更新一次计数标签
+        self.result_buffer = deque()  # 缓存待显示的结果
         self.max_display_results = 5000  # 最大显示结果数量，超过后停止显示但继续计数
         self.display_count = 0  # 已显示的结果数量
         self.is_display_limited = False  # 是否已达到显示限制
 
+        # 固定节拍刷新结果框：结果到达再快，UI 也只按这个周期重排一次
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(100)
+        self._flush_timer.timeout.connect(self.batch_insert_results)
+
         # 设置主窗口布局
         layout = QVBoxLayout()
 
@@ -614,10 +1211,12 @@ class KeywordSearchApp(QMainWindow):
             self.selected_target, keyword, file_filter, use_logical,
             context_lines, ignore_keyword, use_ignore_logical, self.is_folder
         )
-        self.search_thread.search_progress.connect(self.on_search_progress)
+        self.search_thread.search_progress_batch.connect(self.on_search_progress_batch)
+        self.search_thread.count_update.connect(self.on_count_update)
         self.search_thread.search_finished.connect(self.on_search_finished)
         self.search_thread.search_error.connect(self.on_search_error)
         self.search_thread.start()
+        self._flush_timer.start()
 
         mode_str = "逻辑搜索" if use_logical else "普通搜索"
         context_str = f", 上下文: {context_lines}行" if context_lines > 0 else ""
@@ -631,22 +1230,20 @@ class KeywordSearchApp(QMainWindow):
             # 清理缓冲区
             self.result_buffer.clear()
 
-    def on_search_progress(self, result, count):
+    def on_search_progress_batch(self, results, count):
         # 如果已达到显示限制，只更新计数，不显示结果
         if self.is_display_limited:
             self.result_count_label.setText(f"查询到的总数: {count}（已达到显示限制）")
             return
 
-        # 批量处理：收集结果到缓冲区
-        self.result_buffer.append(result)
-
-        # 定期更新计数标签（减少UI更新频率）
-        if count % self.count_update_interval == 0:
-            self.result_count_label.setText(f"查询到的总数: {count}")
+        # 整批进缓冲区，计数标签每批刷新一次；插入交给定时器统一节拍，
+        # 结果洪峰时不会把 UI 线程按批次频率拖进重排
+        self.result_buffer.extend(results)
+        self.result_count_label.setText(f"查询到的总数: {count}")
 
-        # 当缓冲区达到批次大小时，批量插入
-        if len(self.result_buffer) >= self.batch_size:
-            self.batch_insert_results()
+    def on_count_update(self, count):
+        # 显示限制后的轻量计数信号，只刷新标签
+        self.result_count_label.setText(f"查询到的总数: {count}（已达到显示限制）")
 
     def batch_insert_results(self):
         """批量插入结果到UI，使用直接文本插入提高性能"""
@@ -657,6 +1254,9 @@ class KeywordSearchApp(QMainWindow):
         remaining_capacity = self.max_display_results - self.display_count
         if remaining_capacity <= 0:
             self.is_display_limited = True
+            # 通知搜索线程别再打包结果文本，只上报计数
+            if self.search_thread is not None:
+                self.search_thread._display_limited = True
             self.result_buffer.clear()
             # 在末尾添加限制提示
             self.result_box.appendPlainText("\n" + "=" * 80)
@@ -667,30 +1267,38 @@ class KeywordSearchApp(QMainWindow):
         # 确定本次要插入的数量
         results_to_insert = min(len(self.result_buffer), remaining_capacity)
 
-        # 构建要插入的文本（一次性构建，减少字符串操作）
+        # 构建要插入的文本（一次性构建，减少字符串操作）。
+        # 从 deque 左端弹出，已处理的结果即时出队，无需整段切片复制；
+        # 分割线只构造一次，popleft 绑定成局部名
+        separator = "─" * 80 + "\n"
         text_parts = []
-        for i in range(results_to_insert):
-            result = self.result_buffer[i]
+        popleft = self.result_buffer.popleft
+        display_count = self.display_count
+        for _ in range(results_to_insert):
             # 添加分割线（在第一条结果之前不添加）
-            if self.display_count > 0:
-                text_parts.append("─" * 80)
-                text_parts.append("\n")
-            text_parts.append(result)
-            self.display_count += 1
-
-        # 一次性插入所有文本
-        self.result_box.insertPlainText("".join(text_parts))
-
-        # 滚动到底部
-        scrollbar = self.result_box.verticalScrollBar()
-        scrollbar.setValue(scrollbar.maximum())
+            if display_count > 0:
+                text_parts.append(separator)
+            text_parts.append(popleft())
+            display_count += 1
+        self.display_count = display_count
+
+        # 一次性插入所有文本，插入期间关闭重绘，整批只触发一次重排
+        self.result_box.setUpdatesEnabled(False)
+        try:
+            self.result_box.insertPlainText("".join(text_parts))
 
-        # 移除已处理的结果
-        self.result_buffer = self.result_buffer[results_to_insert:]
+            # 滚动到底部
+            scrollbar = self.result_box.verticalScrollBar()
+            scrollbar.setValue(scrollbar.maximum())
+        finally:
+            self.result_box.setUpdatesEnabled(True)
 
         # 检查是否达到限制
         if self.display_count >= self.max_display_results:
             self.is_display_limited = True
+            # 通知搜索线程别再打包结果文本，只上报计数
+            if self.search_thread is not None:
+                self.search_thread._display_limited = True
             self.result_buffer.clear()
             # 在末尾添加限制提示
             self.result_box.appendPlainText("\n" + "=" * 80)
@@ -698,7 +1306,8 @@ class KeywordSearchApp(QMainWindow):
             self.result_box.appendPlainText("=" * 80)
 
     def on_search_finished(self, count, cancelled):
-        # 插入剩余缓冲区内容
+        # 停掉定时器并插入剩余缓冲区内容
+        self._flush_timer.stop()
         self.batch_insert_results()
 
         self.search_button.setText("搜索")